@@ -0,0 +1,69 @@
+"""Index bookkeeping kernels for removing and restoring configuration ids.
+
+If 'numba' is installed, the kernels are JIT compiled. Otherwise a
+vectorized NumPy implementation is used.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _shift_ids_numpy(ids: np.ndarray, removed: np.ndarray) -> np.ndarray:
+    """Shift the 'ids' by the number of 'removed' ids before them."""
+    # every id is shifted by the number of removed ids smaller or equal
+    # to the shifted id. Iterate until the shift does not change anymore.
+    shift = np.searchsorted(removed, ids, side="right")
+    while True:
+        new_shift = np.searchsorted(removed, ids + shift, side="right")
+        if np.array_equal(new_shift, shift):
+            break
+        shift = new_shift
+    return ids + shift
+
+
+def _shift_ids_loop(ids: np.ndarray, removed: np.ndarray) -> np.ndarray:
+    """Shift the 'ids' by the number of 'removed' ids before them.
+
+    Single merge pass over both arrays, meant to be compiled with numba.
+    """
+    out = np.empty_like(ids)
+    j = 0
+    for i in range(ids.size):
+        value = ids[i] + j
+        while j < removed.size and removed[j] <= value:
+            value += 1
+            j += 1
+        out[i] = value
+    return out
+
+
+if numba is not None:
+    _shift_ids = numba.njit(cache=True)(_shift_ids_loop)
+else:
+    _shift_ids = _shift_ids_numpy
+
+
+def shift_ids(ids: np.ndarray, removed: np.ndarray) -> np.ndarray:
+    """Map ids of the cleaned data back onto the ids of the original data.
+
+    Parameters
+    ----------
+    ids : np.ndarray
+        Sorted ids into the data with the 'removed' entries excluded.
+    removed : np.ndarray
+        Sorted ids that were removed from the original data.
+
+    Example
+    -------
+        >>> shift_ids(np.array([0, 1, 2]), np.array([1, 2]))
+        array([0, 3, 4])
+
+    """
+    return _shift_ids(
+        np.ascontiguousarray(ids, dtype=np.intp),
+        np.ascontiguousarray(removed, dtype=np.intp),
+    )
@@ -1,21 +1,25 @@
 """Base Node for ConfigurationSelection."""
 
+import collections
 import dataclasses
+import itertools
 import logging
 import typing
 
 import ase
-import matplotlib.pyplot as plt
 import numpy as np
 import znflow
 import zntrack
 
 from ipsuite_core import base
+from ipsuite_core.base._ids_core import shift_ids
 
 log = logging.getLogger(__name__)
 
 
-def get_flat_data_from_dict(data: dict, silent_ignore: bool = False) -> list:
+def get_flat_data_from_dict(
+    data: typing.Dict[str, list], silent_ignore: bool = False
+) -> list:
     """Flatten a dictionary of lists into a single list.
 
     Parameters
@@ -39,15 +43,23 @@ def get_flat_data_from_dict(data: dict, silent_ignore: bool = False) -> list:
         else:
             raise TypeError(f"data must be a dictionary and not {type(data)}")
 
-    flat_data = []
-    for x in data.values():
-        flat_data.extend(x)
+    # preallocate the result to avoid repeated reallocation for large lists
+    values = list(data.values())
+    flat_data = [None] * sum(len(x) for x in values)
+    start = 0
+    for x in values:
+        stop = start + len(x)
+        flat_data[start:stop] = x
+        start = stop
     return flat_data
 
 
 def get_ids_per_key(
-    data: dict, ids: list, silent_ignore: bool = False
-) -> typing.Dict[str, list]:
+    data: typing.Dict[str, list],
+    ids: typing.Sequence[int],
+    silent_ignore: bool = False,
+    as_list: bool = True,
+) -> typing.Dict[str, typing.List[int]]:
     """Get the ids per key from a dictionary of lists.
 
     Parameters
@@ -61,6 +73,8 @@ def get_ids_per_key(
     silent_ignore : bool, optional
         If True, the function will return the input if it is not a
         dictionary. If False, it will raise a TypeError.
+    as_list : bool, optional
+        If False, the ids are returned as numpy arrays instead of lists.
 
     Example
     -------
@@ -71,122 +85,230 @@ def get_ids_per_key(
     """
     if not isinstance(data, dict):
         if silent_ignore:
-            return np.array(ids).tolist()
+            ids = np.asarray(ids)
+            return ids.tolist() if as_list else ids
         else:
             raise TypeError(f"data must be a dictionary and not {type(data)}")
 
-    ids_per_key = {}
-    ids = np.array(ids).astype(int)
-    ids = np.sort(ids)
-    start = 0
+    ids = np.sort(np.asarray(ids, dtype=np.intp))
+    return _split_ids(ids, list(data), _get_offsets(data), as_list=as_list)
+
+
+def _get_offsets(data: typing.Dict[str, list]) -> np.ndarray:
+    """Get the start of every key in the flattened data, followed by its size."""
+    sizes = np.fromiter((len(x) for x in data.values()), dtype=np.intp, count=len(data))
+    return np.concatenate(([0], np.cumsum(sizes)))
+
+
+def _split_ids(
+    ids: np.ndarray, keys: typing.List[str], offsets: np.ndarray, as_list: bool = True
+) -> typing.Dict[str, typing.List[int]]:
+    """Split the sorted flat 'ids' into ids per key, see 'get_ids_per_key'."""
+    if len(keys) == 0:
+        return {}
+    ids = ids[np.logical_and(ids >= 0, ids < offsets[-1])]
+
+    # assign every id to its key and shift it into the range of that key
+    bucket = np.searchsorted(offsets, ids, side="right") - 1
+    local_ids = ids - offsets[bucket]
+    split_points = np.searchsorted(bucket, np.arange(1, len(keys)))
+    parts = np.split(local_ids, split_points)
+
+    if as_list:
+        parts = [part.tolist() for part in parts]
+    return dict(zip(keys, parts, strict=True))
+
+
+def _merge_ids(
+    ids: typing.List[typing.Dict[str, typing.List[int]]],
+) -> typing.Dict[str, typing.List[int]]:
+    """Merge a list of ids per key into sorted, unique ids per key."""
+    # we assume list[dict]. IF mixed it will raise some error
+    merged = collections.defaultdict(list)
+    for data in ids:
+        for key, value in data.items():
+            if not isinstance(value, list):
+                raise ValueError(
+                    f"Ids can not be {type(value)} but must be "
+                    f"int Found {value} instead."
+                )
+            merged[key].extend(value)
+    return {
+        key: np.unique(np.asarray(val, dtype=np.intp)).tolist()
+        for key, val in merged.items()
+    }
+
+
+def _needs_combine(data: typing.Any) -> bool:
+    """Check if 'data' has to be combined via 'znflow.combine'.
+
+    Dictionaries and flat lists of ase.Atoms are used as they are.
+    """
+    if isinstance(data, dict):
+        return False
+    if isinstance(data, list) and len(data) and isinstance(data[0], ase.Atoms):
+        return False
+    return True
 
-    for key, val in data.items():
-        condition = ids - start
-        condition = np.logical_and(condition < len(val), condition >= 0)
 
-        ids_per_key[key] = np.array(ids[condition] - start).tolist()
-        start += len(val)
+def _drop_ids(data: list, ids: typing.Iterable[int]) -> typing.Iterator:
+    """Iterate over the entries of 'data' whose index is not in 'ids'."""
+    keep = [True] * len(data)
+    for idx in ids:
+        keep[idx] = False
+    return itertools.compress(data, keep)
 
-    return ids_per_key
+
+def ExcludeIds(
+    data: typing.Union[list, typing.Dict[str, list]],
+    ids: typing.Union[typing.List[int], typing.Dict[str, typing.List[int]], None],
+) -> typing.Union["_ExcludeIdsList", "_ExcludeIdsDict"]:
+    """Remove entries from a dataset.
+
+    Depending on the type of 'data' an implementation for either a
+    list or a dictionary of lists is returned.
+    """
+    if isinstance(data, dict):
+        return _ExcludeIdsDict(data, ids)
+    return _ExcludeIdsList(data, ids)
+
+
+def _raise_type_mismatch(data: typing.Any, ids: typing.Any) -> typing.NoReturn:
+    """Raise a TypeError for incompatible 'data' and 'ids'."""
+    raise TypeError(
+        "ids and data must be of the same type. "
+        f"ids is {type(ids)} and data is {type(data)}"
+    )
 
 
 @dataclasses.dataclass
-class ExcludeIds:
-    """Remove entries from a dataset."""
+class _ExcludeIdsList:
+    """Remove entries from a list."""
 
-    data: typing.Union[list, dict]
-    ids: typing.Union[list, dict]
+    data: list
+    ids: typing.Optional[typing.List[int]]
 
     def __post_init__(self):
         """Sort the ids and check if they are valid."""
         if self.ids is None:
-            return
-        if isinstance(self.ids, list):
-            log.debug("ids is list")
-            if isinstance(self.ids[0], dict):
-                log.debug("ids is list of dicts")
-                # we assume list[dict]. IF mixed it will raise some error
-                ids = {}
-                for data in self.ids:
-                    for key, value in data.items():
-                        if key in ids:
-                            ids[key].extend(value)
-                        else:
-                            if not isinstance(value, list):
-                                raise ValueError(
-                                    f"Ids can not be {type(value)} but must be "
-                                    f"int Found {value} instead."
-                                )
-                            ids[key] = value
-                self.ids = {}
-                for key, val in ids.items():
-                    self.ids[key] = np.sort(val).astype(int).tolist()
-            else:
-                log.debug("ids is list of ints")
-                self.ids = np.sort(self.ids).astype(int).tolist()
-        else:
-            log.debug("ids is dict")
-            for key, ids in self.ids.items():
-                self.ids[key] = np.sort(ids).astype(int).tolist()
+            self.ids = []
+        if isinstance(self.ids, dict) or (
+            len(self.ids) and isinstance(self.ids[0], dict)
+        ):
+            _raise_type_mismatch(self.data, self.ids)
+        log.debug("ids is list of ints")
+        self.ids = np.unique(np.asarray(self.ids, dtype=np.intp)).tolist()
+        # set for O(1) membership tests in 'get_clean_data'
+        self._ids_set = set(self.ids)
+        self._ids_arr = np.asarray(self.ids, dtype=np.intp)
 
     def get_clean_data(self, flatten: bool = False) -> list:
         """Remove the 'ids' from the 'data'."""
-        # TODO do we need a dict return here or could we just return a flat list?
+        if not self.ids:
+            # nothing to exclude
+            return self.data
+        return [x for i, x in enumerate(self.data) if i not in self._ids_set]
+
+    def get_original_ids(
+        self, ids: typing.Sequence[int], per_key: bool = False, as_list: bool = True
+    ) -> typing.List[int]:
+        """Shift the 'ids' such that they are valid for the initial data.
+
+        If 'as_list' is False, a numpy array is returned instead of a list.
+        """
+        ids = shift_ids(np.sort(np.asarray(ids, dtype=np.intp)), self._ids_arr)
+        return ids.tolist() if as_list else ids
+
+    @property
+    def ids_as_list(self) -> typing.List[int]:
+        """Return the ids as a list."""
+        return self.ids
+
+
+@dataclasses.dataclass
+class _ExcludeIdsDict:
+    """Remove entries from a dictionary of lists."""
+
+    data: typing.Dict[str, list]
+    ids: typing.Union[
+        typing.Dict[str, typing.List[int]],
+        typing.List[typing.Dict[str, typing.List[int]]],
+        None,
+    ]
+
+    def __post_init__(self):
+        """Sort the ids and check if they are valid."""
+        self._keys = list(self.data)
+        self._offsets = _get_offsets(self.data)
+
         if self.ids is None:
-            if isinstance(self.data, list):
-                return self.data
-            elif isinstance(self.data, dict):
-                if flatten:
-                    return get_flat_data_from_dict(self.data)
-                return self.data
-        if isinstance(self.data, list) and isinstance(self.ids, list):
-            return [x for i, x in enumerate(self.data) if i not in self.ids]
-        elif isinstance(self.data, dict) and isinstance(self.ids, dict):
+            self.ids = {}
+        elif isinstance(self.ids, list):
+            if len(self.ids) and not isinstance(self.ids[0], dict):
+                _raise_type_mismatch(self.data, self.ids)
+            log.debug("ids is list of dicts")
+            self.ids = _merge_ids(self.ids)
+        else:
+            log.debug("ids is dict")
+            self.ids = {
+                key: np.unique(np.asarray(val, dtype=np.intp)).tolist()
+                for key, val in self.ids.items()
+            }
+
+        # sets for O(1) membership tests in 'get_clean_data'
+        self._ids_set = {key: set(val) for key, val in self.ids.items()}
+        self._ids_as_list = self._flatten_ids()
+        self._ids_arr = np.asarray(self._ids_as_list, dtype=np.intp)
+
+    def get_clean_data(
+        self, flatten: bool = False
+    ) -> typing.Union[list, typing.Dict[str, list]]:
+        """Remove the 'ids' from the 'data'."""
+        # TODO do we need a dict return here or could we just return a flat list?
+        if not self._ids_as_list:
+            # nothing to exclude
+            clean_data = self.data
+        else:
             clean_data = {}
             for key, data in self.data.items():
-                if key in self.ids:
+                if key in self._ids_set:
                     clean_data[key] = [
-                        x for i, x in enumerate(data) if i not in self.ids[key]
+                        x for i, x in enumerate(data) if i not in self._ids_set[key]
                     ]
                 else:
                     clean_data[key] = data
-            if flatten:
-                return get_flat_data_from_dict(clean_data)
-            return clean_data
-        else:
-            raise TypeError(
-                "ids and data must be of the same type. "
-                f"ids is {type(self.ids)} and data is {type(self.data)}"
-            )
-
-    def get_original_ids(self, ids: list, per_key: bool = False) -> list:
-        """Shift the 'ids' such that they are valid for the initial data."""
-        ids = np.array(ids).astype(int)
-        ids = np.sort(ids)
-
-        if isinstance(self.ids, list):
-            for removed_id in self.ids:
-                ids[ids >= removed_id] += 1
-        elif isinstance(self.ids, dict):
-            for removed_id in self.ids_as_list:
-                ids[ids >= removed_id] += 1
+        if flatten:
+            return get_flat_data_from_dict(clean_data)
+        return clean_data
+
+    def get_original_ids(
+        self, ids: typing.Sequence[int], per_key: bool = False, as_list: bool = True
+    ) -> typing.Union[typing.List[int], typing.Dict[str, typing.List[int]]]:
+        """Shift the 'ids' such that they are valid for the initial data.
+
+        If 'as_list' is False, numpy arrays are returned instead of lists.
+        """
+        ids = shift_ids(np.sort(np.asarray(ids, dtype=np.intp)), self._ids_arr)
         if per_key:
-            return get_ids_per_key(self.data, ids, silent_ignore=True)
-        return ids.tolist()
+            return _split_ids(ids, self._keys, self._offsets, as_list=as_list)
+        return ids.tolist() if as_list else ids
 
     @property
-    def ids_as_list(self) -> list:
+    def ids_as_list(self) -> typing.List[int]:
         """Return the ids as a list."""
+        return self._ids_as_list
+
+    def _flatten_ids(self) -> typing.List[int]:
+        """Convert the ids per key into ids of the flattened data."""
         # {a: [1, 2], b: [1, 3]}
         # {a: list(10), b:list(10)}
         # [1, 2, 1+10, 3+10]
-        ids = []
-        size = 0
-        for key in self.data:
+        ids = [
+            np.asarray(self.ids[key], dtype=np.intp) + offset
             # we iterate through data, not ids, because ids must not contain all keys
-            if key in self.ids:
-                ids.append(np.array(self.ids[key]) + size)
-            size += len(self.data[key])
+            for key, offset in zip(self._keys, self._offsets[:-1], strict=True)
+            if key in self.ids
+        ]
         if len(ids):
             ids = np.concatenate(ids)
             ids = np.sort(ids)
@@ -219,7 +341,7 @@ class ConfigurationSelection(base.ProcessAtoms):
     _name_ = "ConfigurationSelection"
 
     def _post_init_(self):
-        if self.data is not None and not isinstance(self.data, dict):
+        if self.data is not None and _needs_combine(self.data):
             try:
                 self.data = znflow.combine(
                     self.data, attribute="atoms", return_dict_attr="name"
@@ -234,16 +356,10 @@ class ConfigurationSelection(base.ProcessAtoms):
                 self.exclude_configurations = {}
             if not isinstance(self.exclude, list):
                 self.exclude = [self.exclude]
+            exclude_configurations = self.exclude_configurations
             for exclude in self.exclude:
-                for key in exclude.selected_configurations:
-                    if key in self.exclude_configurations:
-                        self.exclude_configurations[key].extend(
-                            exclude.selected_configurations[key]
-                        )
-                    else:
-                        self.exclude_configurations[key] = (
-                            exclude.selected_configurations[key]
-                        )
+                for key, val in exclude.selected_configurations.items():
+                    exclude_configurations.setdefault(key, []).extend(val)
 
         exclude = ExcludeIds(self.get_data(), self.exclude_configurations)
         data = exclude.get_clean_data(flatten=True)
@@ -274,16 +390,21 @@ class ConfigurationSelection(base.ProcessAtoms):
         """
         raise NotImplementedError
 
+    def _get_selected_sets(self) -> typing.Union[set, typing.Dict[str, set]]:
+        """Convert the selected configurations to sets for fast lookups."""
+        if isinstance(self.selected_configurations, dict):
+            return {key: set(val) for key, val in self.selected_configurations.items()}
+        return set(self.selected_configurations)
+
     @property
     def atoms(self) -> typing.Sequence[ase.Atoms]:
         """Get a list of the selected atoms objects."""
         with znflow.disable_graph():
             results = []
             data = self.get_data()
+            selected = self._get_selected_sets()
             if isinstance(data, list):
-                for idx, atoms in enumerate(self.get_data()):
-                    if idx in self.selected_configurations:
-                        results.append(atoms)
+                results.extend(data[idx] for idx in sorted(selected))
             elif isinstance(data, dict):
                 # This only triggers, if the file was changed manually.
                 if data.keys() != self.selected_configurations.keys():
@@ -292,10 +413,8 @@ class ConfigurationSelection(base.ProcessAtoms):
                         f" selected keys {self.selected_configurations.keys()}"
                     )
                 for key, atoms_lst in data.items():
-                    if key in self.selected_configurations:
-                        for idx, atoms in enumerate(atoms_lst):
-                            if idx in self.selected_configurations[key]:
-                                results.append(atoms)
+                    if key in selected:
+                        results.extend(atoms_lst[idx] for idx in sorted(selected[key]))
             else:
                 raise ValueError(f"Data must be a list or dict, not {type(data)}")
             return results
@@ -306,12 +425,11 @@ class ConfigurationSelection(base.ProcessAtoms):
         with znflow.disable_graph():
             results = []
             data = self.get_data()
+            selected = self._get_selected_sets()
             if isinstance(data, list) and isinstance(
                 self.selected_configurations, list
             ):
-                for idx, atoms in enumerate(data):
-                    if idx not in self.selected_configurations:
-                        results.append(atoms)
+                results.extend(_drop_ids(data, selected))
             elif isinstance(data, dict) and isinstance(
                 self.selected_configurations, dict
             ):
@@ -325,22 +443,39 @@ class ConfigurationSelection(base.ProcessAtoms):
                     if key not in self.selected_configurations:
                         results.extend(atoms_lst)
                     else:
-                        for idx, atoms in enumerate(atoms_lst):
-                            if idx not in self.selected_configurations[key]:
-                                results.append(atoms)
+                        results.extend(_drop_ids(atoms_lst, selected[key]))
             else:
                 raise ValueError(f"Data must be a list or dict, not {type(data)}")
             return results
 
     def _get_plot(self, atoms_lst: typing.List[ase.Atoms], indices: typing.List[int]):
         """Plot the selected configurations."""
+        import matplotlib.pyplot as plt
+
         # if energies are available, plot them, otherwise just plot indices over time
         fig, ax = plt.subplots()
 
+        # probe the first configuration before collecting all energies
         try:
-            line_data = np.array([atoms.get_potential_energy() for atoms in atoms_lst])
-            ax.set_ylabel("Energy")
+            atoms_lst[0].get_potential_energy()
+            has_energy = True
         except Exception:
+            has_energy = False
+
+        if has_energy:
+            try:
+                line_data = np.fromiter(
+                    (atoms.get_potential_energy() for atoms in atoms_lst),
+                    dtype=np.float64,
+                    count=len(atoms_lst),
+                )
+            except Exception:
+                # only some of the configurations provide an energy
+                has_energy = False
+
+        if has_energy:
+            ax.set_ylabel("Energy")
+        else:
             line_data = np.arange(len(atoms_lst))
             ax.set_ylabel("Configuration")
 
@@ -366,7 +501,7 @@ class BatchConfigurationSelection(ConfigurationSelection):
     train_data: list[ase.Atoms] = zntrack.deps()
 
     def _post_init_(self):
-        if self.train_data is not None and not isinstance(self.train_data, dict):
+        if self.train_data is not None and _needs_combine(self.train_data):
             try:
                 self.train_data = znflow.combine(
                     self.train_data, attribute="atoms", return_dict_attr="name"
@@ -374,7 +509,7 @@ class BatchConfigurationSelection(ConfigurationSelection):
             except TypeError:
                 self.train_data = znflow.combine(self.train_data, attribute="atoms")
 
-        if self.data is not None and not isinstance(self.data, dict):
+        if self.data is not None and _needs_combine(self.data):
             try:
                 self.data = znflow.combine(
                     self.data, attribute="atoms", return_dict_attr="name"